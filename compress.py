@@ -0,0 +1,168 @@
+#import libraries
+import collections
+import threading
+import zlib
+
+import instrument
+
+#brotli is used where it is installed; the python27 runtime lacks it, so
+#production falls back to gzip
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+
+COMPRESSIBLE_TYPES = ('text/html', 'text/plain', 'text/css',
+                      'application/json', 'application/javascript')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+#bodies shorter than this cost more to compress than they save
+MIN_LENGTH = 512
+#compressed bodies kept per instance, keyed by scheme, host, URL, ETag and
+#encoding
+CACHE_SIZE = 200
+
+
+def accepted_encoding(accept_encoding):
+  """Picks the best encoding the client accepts: br, then gzip, else None."""
+  accepted = set()
+  for part in accept_encoding.lower().split(','):
+    name, _, params = part.partition(';')
+    params = params.replace(' ', '')
+    try:
+      if params.startswith('q=') and float(params[2:]) == 0:
+        continue
+    except ValueError:
+      continue
+    accepted.add(name.strip())
+  if brotli is not None and 'br' in accepted:
+    return 'br'
+  if 'gzip' in accepted or '*' in accepted:
+    return 'gzip'
+  return None
+
+def compressor(encoding):
+  """Returns a function compressing one chunk, flushed so it can be sent
+  at once; called with None it finishes the stream."""
+  if encoding == 'br':
+    stream = brotli.Compressor(quality=BROTLI_QUALITY)
+    def compress(chunk):
+      if chunk is None:
+        return stream.finish()
+      return stream.process(chunk) + stream.flush()
+  else:
+    stream = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    def compress(chunk):
+      if chunk is None:
+        return stream.flush()
+      return stream.compress(chunk) + stream.flush(zlib.Z_SYNC_FLUSH)
+  return compress
+
+
+class CompressedBodies(object):
+  """Least recently used compressed bodies. Pages set an ETag built from
+  the content versions they show, so an entry (keyed by scheme, host,
+  URL, ETag and encoding) is reused until the content changes, and
+  compression runs once per change instead of once per request."""
+  def __init__(self, size=CACHE_SIZE):
+    self.size = size
+    self.bodies = collections.OrderedDict()
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    with self.lock:
+      body = self.bodies.pop(key, None)
+      if body is not None:
+        self.bodies[key] = body
+      return body
+
+  def set(self, key, body):
+    with self.lock:
+      self.bodies.pop(key, None)
+      self.bodies[key] = body
+      while len(self.bodies) > self.size:
+        self.bodies.popitem(last=False)
+
+  def clear(self):
+    with self.lock:
+      self.bodies.clear()
+
+cache = CompressedBodies()
+
+
+class CompressMiddleware(object):
+  """WSGI middleware that gzips (or brotli-compresses) text responses
+  for clients that accept it, reusing cached bodies for known ETags."""
+  def __init__(self, app):
+    self.app = app
+
+  def __call__(self, environ, start_response):
+    encoding = None
+    if environ.get('REQUEST_METHOD') != 'HEAD':
+      encoding = accepted_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+    #pages embed absolute links to their own scheme and host (the sign-in
+    #URLs), so a body is only reused for the same ones
+    url = (environ.get('wsgi.url_scheme'), environ.get('HTTP_HOST'),
+           environ.get('PATH_INFO', ''), environ.get('QUERY_STRING', ''))
+    response = {}
+
+    def compressing_start_response(status, headers, exc_info=None):
+      fields = dict((name.lower(), value) for name, value in headers)
+      content_type = fields.get('content-type', '').split(';')[0].strip()
+      length = fields.get('content-length')
+      if (not status.startswith('200') or
+          content_type not in COMPRESSIBLE_TYPES or
+          'content-encoding' in fields or
+          length is not None and int(length) < MIN_LENGTH):
+        return start_response(status, headers, exc_info)
+
+      vary = [value.strip() for value in fields.get('vary', '').split(',')
+              if value.strip()]
+      headers = [(name, value) for name, value in headers
+                 if name.lower() not in ('vary', 'content-length')]
+      headers.append(('Vary', ', '.join(vary + ['Accept-Encoding'])))
+      if encoding is None:
+        if length is not None:
+          headers.append(('Content-Length', length))
+        return start_response(status, headers, exc_info)
+
+      response['key'] = None
+      response['cached'] = None
+      if fields.get('etag'):
+        response['key'] = (url, fields['etag'], encoding)
+        response['cached'] = cache.get(response['key'])
+      headers.append(('Content-Encoding', encoding))
+      if response['cached'] is not None:
+        headers.append(('Content-Length', str(len(response['cached']))))
+      return start_response(status, headers, exc_info)
+
+    body = self.app(environ, compressing_start_response)
+    try:
+      if 'key' not in response:
+        for chunk in body:
+          yield chunk
+      elif response['cached'] is not None:
+        instrument.note(compressed_cache='hit')
+        yield response['cached']
+      else:
+        #only bodies that will be cached are collected, so long streams
+        #without an ETag pass through in constant memory
+        compress = compressor(encoding)
+        sent = []
+        for chunk in body:
+          with instrument.phase('compress'):
+            compressed = compress(chunk)
+          if response['key']:
+            sent.append(compressed)
+          if compressed:
+            yield compressed
+        with instrument.phase('compress'):
+          compressed = compress(None)
+        yield compressed
+        if response['key']:
+          sent.append(compressed)
+          cache.set(response['key'], ''.join(sent))
+    finally:
+      if hasattr(body, 'close'):
+        body.close()
@@ -0,0 +1,131 @@
+#import libraries
+import csv
+import json
+import StringIO
+import time
+from google.appengine.api import datastore_errors
+from google.appengine.ext import ndb
+
+from coursenotes import Card, Comment, Handler, cardlist_key, comments_key
+from coursenotes import DEFAULT_COURSE, COURSE_NAME
+
+
+#entities read per batch; the ndb caches are bypassed so a batch is
+#released once it has been written out and memory stays flat
+EXPORT_BATCH_SIZE = 500
+#the export stops at a batch boundary after this long, well inside the
+#request deadline, and the client continues from the last cursor
+EXPORT_SECONDS = 45
+#the front end buffers a response up to 32 MB; the export also stops at a
+#batch boundary once this much has been sent, and a batch of comments is
+#at most a few MB, so a response stays well under the limit
+EXPORT_BYTES = 8 * 1024 * 1024
+
+COMMENT_FIELDS = ('id', 'date', 'identity', 'name', 'email', 'content')
+CARD_FIELDS = ('id', 'order', 'stage', 'worksession', 'title', 'content',
+               'content_hash')
+
+#marks the end of each batch in the output; the value is the cursor to
+#resume from, empty once everything has been exported
+CURSOR_MARKER = '#cursor'
+
+
+def comment_record(comment):
+  return {'id': comment.key.id(),
+          'date': comment.date.isoformat() if comment.date else None,
+          'identity': comment.author and comment.author.identity,
+          'name': comment.author and comment.author.name,
+          'email': comment.author and comment.author.email,
+          'content': comment.content}
+
+def card_record(card):
+  record = dict((field, getattr(card, field)) for field in CARD_FIELDS[1:])
+  record['id'] = card.key.id()
+  return record
+
+EXPORTS = {
+  'comments': (Comment, comments_key, COMMENT_FIELDS, comment_record),
+  'cards': (Card, cardlist_key, CARD_FIELDS, card_record),
+}
+
+
+def export_batches(kind, course=DEFAULT_COURSE, cursor=None,
+                   seconds=EXPORT_SECONDS):
+  """Walks a course's comments or cards in key order, yielding each batch
+  of records with the cursor after it (None after the last batch).
+  Stops after the first batch that ends past the time limit."""
+  model, group_key, _, record = EXPORTS[kind]
+  query = model.query(ancestor=group_key(course))
+  start = time.time()
+  while True:
+    entities, next_cursor, more = query.fetch_page(
+      EXPORT_BATCH_SIZE, start_cursor=cursor,
+      use_cache=False, use_memcache=False)
+    cursor = next_cursor if more else None
+    yield [record(entity) for entity in entities], cursor
+    if cursor is None or time.time() - start > seconds:
+      return
+
+#each format yields one chunk per batch, ending with its cursor line
+def jsonl_lines(kind, batches, header=True):
+  for records, cursor in batches:
+    lines = [json.dumps(record, sort_keys=True) + '\n' for record in records]
+    lines.append(json.dumps({CURSOR_MARKER: cursor and cursor.urlsafe()}))
+    yield ''.join(lines) + '\n'
+
+def csv_lines(kind, batches, header=True):
+  fields = EXPORTS[kind][2]
+  for records, cursor in batches:
+    out = StringIO.StringIO()
+    writer = csv.writer(out)
+    if header:
+      writer.writerow(fields)
+      header = False
+    for record in records:
+      writer.writerow([unicode(record[field]).encode('utf-8')
+                       if record[field] is not None else ''
+                       for field in fields])
+    writer.writerow([CURSOR_MARKER, cursor.urlsafe() if cursor else ''])
+    yield out.getvalue()
+
+FORMATS = {
+  'jsonl': ('application/x-ndjson', jsonl_lines),
+  'csv': ('text/csv', csv_lines),
+}
+
+def within_budget(chunks, limit=EXPORT_BYTES):
+  """Passes chunks through until limit bytes have been sent. The chunk
+  that crosses the limit is the last, so the response ends on a cursor."""
+  sent = 0
+  for chunk in chunks:
+    yield chunk
+    sent += len(chunk)
+    if sent >= limit:
+      chunks.close()
+      return
+
+
+class ExportHandler(Handler):
+  def get(self):
+    #stream a course's comments or cards as JSONL or CSV, batch by batch;
+    #a cursor line follows each batch so a cut-off export can be resumed
+    kind = self.request.get('kind', 'comments')
+    output = self.request.get('format', 'jsonl')
+    course = self.request.get('course') or DEFAULT_COURSE
+    if (kind not in EXPORTS or output not in FORMATS or
+        not COURSE_NAME.match(course)):
+      self.abort(400)
+    cursor = None
+    if self.request.get('cursor'):
+      try:
+        cursor = ndb.Cursor(urlsafe=self.request.get('cursor'))
+      except datastore_errors.BadValueError:
+        self.abort(400)
+
+    content_type, lines = FORMATS[output]
+    self.response.headers['Content-Type'] = content_type
+    self.response.headers['Content-Disposition'] = (
+      'attachment; filename="%s-%s.%s"' % (course, kind, output))
+    #a resumed CSV export continues without repeating the header row
+    batches = export_batches(kind, course, cursor)
+    self.stream(within_budget(lines(kind, batches, header=cursor is None)))
@@ -0,0 +1,185 @@
+#import libraries
+import collections
+import contextlib
+import json
+import logging
+import threading
+import time
+from google.appengine.api import apiproxy_stub_map
+
+
+#each request records into its own RequestStats, held per thread
+#because the app runs with threadsafe: true
+local = threading.local()
+
+#process-wide totals per route, served by the stats endpoint; requests are
+#grouped by the route template they matched and by a known method, so the
+#number of entries is fixed by the app, not by the paths clients send
+totals = {}
+totals_lock = threading.Lock()
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'DELETE', 'OPTIONS')
+UNMATCHED = 'other'
+
+
+class RequestStats(object):
+  """Timings, datastore RPCs and notes collected for one request."""
+  def __init__(self, method, path):
+    self.method = method
+    self.path = path
+    self.route = None
+    self.start = time.time()
+    self.phases = collections.OrderedDict()
+    self.rpcs = collections.Counter()
+    self.rpc_bytes = 0
+    self.notes = {}
+
+  def record(self, name, ms):
+    self.phases[name] = self.phases.get(name, 0) + ms
+
+  def as_dict(self, status):
+    return {
+      'method': self.method,
+      'path': self.path,
+      'route': self.route,
+      'status': status,
+      'total_ms': round((time.time() - self.start) * 1000, 2),
+      'phases_ms': dict((name, round(ms, 2)) for name, ms in self.phases.items()),
+      'rpcs': dict(self.rpcs),
+      'rpc_bytes': self.rpc_bytes,
+      'notes': self.notes,
+    }
+
+
+def current():
+  return getattr(local, 'stats', None)
+
+def record(name, ms):
+  """Adds ms to a phase of the current request, if one is being recorded."""
+  stats = current()
+  if stats is not None:
+    stats.record(name, ms)
+
+def phase_ms(name):
+  """Returns the time recorded so far for a phase of the current request."""
+  stats = current()
+  return stats.phases.get(name, 0) if stats is not None else 0
+
+def set_route(template):
+  """Names the route template the current request matched."""
+  stats = current()
+  if stats is not None:
+    stats.route = template
+
+def note(**values):
+  """Attaches values such as result sizes to the current request's log."""
+  stats = current()
+  if stats is not None:
+    stats.notes.update(values)
+
+@contextlib.contextmanager
+def phase(name):
+  """Times the enclosed block as a phase of the current request."""
+  start = time.time()
+  try:
+    yield
+  finally:
+    record(name, (time.time() - start) * 1000)
+
+def time_future(name, future):
+  """Records the time until an async future completes as a phase."""
+  stats = current()
+  start = time.time()
+  if stats is not None:
+    future.add_callback(
+      lambda: stats.record(name, (time.time() - start) * 1000))
+  return future
+
+def server_timing():
+  """Formats the phases so far as a Server-Timing header value."""
+  stats = current()
+  if stats is None:
+    return ''
+  return ', '.join('%s;dur=%.1f' % (name, ms)
+                   for name, ms in stats.phases.items())
+
+
+#counts every API call and its payload size against the current request
+def count_rpc(service, call, request, response):
+  stats = current()
+  if stats is None:
+    return
+  stats.rpcs['%s.%s' % (service, call)] += 1
+  try:
+    stats.rpc_bytes += request.ByteSize() + response.ByteSize()
+  except AttributeError:
+    pass
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('instrument', count_rpc)
+
+
+def add_to_totals(summary):
+  method = summary['method'] if summary['method'] in METHODS else UNMATCHED
+  route = '%s %s' % (method, summary['route'] or UNMATCHED)
+  with totals_lock:
+    route_totals = totals.setdefault(route, {
+      'requests': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+      'phases_ms': collections.Counter(), 'rpcs': collections.Counter(),
+      'rpc_bytes': 0})
+    route_totals['requests'] += 1
+    route_totals['total_ms'] += summary['total_ms']
+    route_totals['max_ms'] = max(route_totals['max_ms'], summary['total_ms'])
+    route_totals['phases_ms'].update(summary['phases_ms'])
+    route_totals['rpcs'].update(summary['rpcs'])
+    route_totals['rpc_bytes'] += summary['rpc_bytes']
+
+def snapshot():
+  """Returns the per-route totals with averages, ready for JSON."""
+  with totals_lock:
+    result = {}
+    for route, route_totals in totals.items():
+      requests = float(route_totals['requests'])
+      result[route] = {
+        'requests': route_totals['requests'],
+        'mean_ms': round(route_totals['total_ms'] / requests, 2),
+        'max_ms': route_totals['max_ms'],
+        'mean_phases_ms': dict((name, round(ms / requests, 2)) for name, ms
+                               in route_totals['phases_ms'].items()),
+        'mean_rpcs': dict((name, round(count / requests, 2)) for name, count
+                          in route_totals['rpcs'].items()),
+        'mean_rpc_bytes': int(route_totals['rpc_bytes'] / requests),
+      }
+    return result
+
+
+class InstrumentMiddleware(object):
+  """WSGI middleware that records and logs per-request stats."""
+  def __init__(self, app):
+    self.app = app
+
+  def __call__(self, environ, start_response):
+    stats = RequestStats(environ.get('REQUEST_METHOD'),
+                         environ.get('PATH_INFO'))
+    local.stats = stats
+    status = []
+
+    def instrumented_start_response(response_status, headers, exc_info=None):
+      status.append(response_status)
+      headers = [(name, value) for name, value in headers
+                 if name.lower() != 'server-timing']
+      headers.append(('Server-Timing', server_timing()))
+      return start_response(response_status, headers, exc_info)
+
+    try:
+      body = self.app(environ, instrumented_start_response)
+      #time handing the body to the server as the response write phase
+      with phase('response'):
+        for chunk in body:
+          yield chunk
+        if hasattr(body, 'close'):
+          body.close()
+    finally:
+      local.stats = None
+      summary = stats.as_dict(status[0].split()[0] if status else None)
+      add_to_totals(summary)
+      logging.info('request stats %s', json.dumps(summary, sort_keys=True))
@@ -0,0 +1,167 @@
+#import libraries
+import cgi
+import re
+from HTMLParser import HTMLParser
+
+
+#tags and attributes allowed in card content; everything else is dropped
+ALLOWED_TAGS = {
+  'a': ('href',),
+  'br': (),
+  'dd': (),
+  'div': ('class',),
+  'dl': (),
+  'dt': (),
+  'iframe': ('src', 'width', 'height', 'allowfullscreen'),
+  'img': ('src', 'alt', 'class'),
+  'li': (),
+  'ol': (),
+  'p': ('class',),
+  'span': ('class',),
+  'table': ('class',),
+  'td': (),
+  'th': (),
+  'tr': (),
+  'ul': (),
+}
+VOID_TAGS = ('br', 'img')
+#tags whose text is dropped along with the tag
+DROPPED_TAGS = ('script', 'style')
+
+#links and images may only point to web addresses, and embeds only to YouTube
+SAFE_URL = re.compile(r'^(https?:|/|#)', re.IGNORECASE)
+SAFE_EMBED = re.compile(r'^https://www\.youtube\.com/embed/', re.IGNORECASE)
+WHITESPACE = re.compile(r'\s+', re.UNICODE)
+
+
+class Sanitizer(HTMLParser):
+  """Rebuilds HTML from the allowed tags only, collapsing whitespace."""
+  def __init__(self):
+    HTMLParser.__init__(self)
+    self.out = []
+    self.open_tags = []
+    self.dropping = 0
+
+  def handle_starttag(self, tag, attrs):
+    if tag in DROPPED_TAGS:
+      self.dropping += 1
+    if tag not in ALLOWED_TAGS:
+      return
+    kept = []
+    for name, value in attrs:
+      if name not in ALLOWED_TAGS[tag]:
+        continue
+      if name == 'src' and tag == 'iframe' and not SAFE_EMBED.match(value or ''):
+        return
+      if name in ('href', 'src') and not SAFE_URL.match(value or ''):
+        continue
+      if value is None:
+        kept.append(' %s' % name)
+      else:
+        kept.append(' %s="%s"' % (name, cgi.escape(value, quote=True)))
+    self.out.append('<%s%s>' % (tag, ''.join(kept)))
+    if tag not in VOID_TAGS:
+      self.open_tags.append(tag)
+
+  def handle_startendtag(self, tag, attrs):
+    self.handle_starttag(tag, attrs)
+    if tag not in VOID_TAGS and self.open_tags[-1:] == [tag]:
+      self.handle_endtag(tag)
+
+  def handle_endtag(self, tag):
+    if tag in DROPPED_TAGS:
+      self.dropping = max(self.dropping - 1, 0)
+    #close only tags that are open, so stray end tags cannot break the page
+    if tag not in self.open_tags:
+      return
+    while self.open_tags:
+      open_tag = self.open_tags.pop()
+      self.out.append('</%s>' % open_tag)
+      if open_tag == tag:
+        break
+
+  def handle_data(self, data):
+    if self.dropping:
+      return
+    self.out.append(cgi.escape(WHITESPACE.sub(' ', data)))
+
+  def handle_entityref(self, name):
+    self.out.append('&%s;' % name)
+
+  def handle_charref(self, name):
+    self.out.append('&#%s;' % name)
+
+  def result(self):
+    self.close()
+    while self.open_tags:
+      self.out.append('</%s>' % self.open_tags.pop())
+    return WHITESPACE.sub(' ', ''.join(self.out)).strip()
+
+
+def clean_html(html):
+  """Returns html reduced to the allowed tags and minified."""
+  sanitizer = Sanitizer()
+  sanitizer.feed(html or '')
+  return sanitizer.result()
+
+
+class TextExtractor(HTMLParser):
+  """Collects the text of an HTML fragment, for search indexing."""
+  def __init__(self):
+    HTMLParser.__init__(self)
+    self.parts = []
+    self.dropping = 0
+
+  #tags separate words, entities and text run together
+  def handle_starttag(self, tag, attrs):
+    if tag in DROPPED_TAGS:
+      self.dropping += 1
+    self.parts.append(' ')
+
+  def handle_endtag(self, tag):
+    if tag in DROPPED_TAGS:
+      self.dropping = max(self.dropping - 1, 0)
+    self.parts.append(' ')
+
+  def handle_data(self, data):
+    if not self.dropping:
+      self.parts.append(data)
+
+  def handle_entityref(self, name):
+    self.parts.append(self.unescape('&%s;' % name))
+
+  def handle_charref(self, name):
+    self.parts.append(self.unescape('&#%s;' % name))
+
+
+def html_text(html):
+  """Returns the text of html with tags removed and entities decoded."""
+  extractor = TextExtractor()
+  extractor.feed(html or '')
+  extractor.close()
+  return WHITESPACE.sub(' ', ''.join(extractor.parts)).strip()
+
+
+#search snippets mark the matched terms with <b> tags around plain text
+HIGHLIGHT = re.compile(r'(</?b>)', re.IGNORECASE)
+
+def snippet_html(snippet):
+  """Returns a search snippet as HTML: the text is escaped, since comments
+  come from users, and only balanced <b> highlighting is kept."""
+  out = []
+  bold = False
+  for part in HIGHLIGHT.split(snippet or ''):
+    tag = part.lower()
+    if tag == '<b>':
+      if not bold:
+        out.append('<b>')
+        bold = True
+    elif tag == '</b>':
+      if bold:
+        out.append('</b>')
+        bold = False
+    else:
+      out.append(cgi.escape(part))
+  if bold:
+    out.append('</b>')
+  return ''.join(out)
@@ -0,0 +1,155 @@
+//loads the cards and comments of the course page from the JSON API;
+//cards are kept in localStorage by id, so a returning visitor downloads
+//only the cards whose hash changed and only the comments posted since
+(function() {
+	var script = document.currentScript;
+	var base = script.getAttribute('data-course-path');
+	var api = base + '/api/v1';
+	var cardsKey = 'cards:' + api;
+	var commentsKey = 'comments:' + api;
+
+	//must match COMMENTS_PER_PAGE and API_MAX_IDS in coursenotes.py
+	var COMMENTS_PER_PAGE = 20;
+	var MAX_IDS = 100;
+	var REFRESH_MS = 60000;
+
+	function load(key) {
+		try {
+			return JSON.parse(localStorage.getItem(key));
+		} catch (e) {
+			return null;
+		}
+	}
+
+	function save(key, value) {
+		try {
+			localStorage.setItem(key, JSON.stringify(value));
+		} catch (e) {
+			//storage full or disabled: the page still shows, only uncached
+		}
+	}
+
+	function get(url, done) {
+		var request = new XMLHttpRequest();
+		request.open('GET', url);
+		request.onload = function() {
+			if (request.status === 200) {
+				done(JSON.parse(request.responseText));
+			}
+		};
+		request.send();
+	}
+
+	function element(tag, className, text) {
+		var node = document.createElement(tag);
+		if (className) {
+			node.className = className;
+		}
+		if (text !== undefined) {
+			node.textContent = text;
+		}
+		return node;
+	}
+
+	//builds the same markup as card_list.html and comment_list.html
+	function cardElement(id, title, fill) {
+		var card = element('div', 'card');
+		var heading = element('div', 'card-title');
+		var content = element('div', 'card-content');
+		var inner = element('div', 'content');
+		var topic = element('div', 'content-topic');
+		if (id) {
+			card.id = id;
+		}
+		heading.appendChild(element('h3', null, title));
+		fill(topic);
+		inner.appendChild(topic);
+		content.appendChild(inner);
+		card.appendChild(heading);
+		card.appendChild(content);
+		return card;
+	}
+
+	function showCards(index, stored) {
+		var list = document.getElementById('cards');
+		list.innerHTML = '';
+		index.forEach(function(entry) {
+			var card = stored[entry.id];
+			list.appendChild(cardElement(card.id, card.title, function(topic) {
+				//card html is sanitized when the card is stored
+				topic.innerHTML = card.html;
+			}));
+		});
+	}
+
+	function fetchCards(ids, stored, done) {
+		if (!ids.length) {
+			return done();
+		}
+		get(api + '/cards?ids=' + ids.slice(0, MAX_IDS).map(encodeURIComponent).join(','), function(data) {
+			data.cards.forEach(function(card) {
+				stored[card.id] = card;
+			});
+			fetchCards(ids.slice(MAX_IDS), stored, done);
+		});
+	}
+
+	function loadCards() {
+		var stored = load(cardsKey) || {};
+		get(api + '/cards', function(data) {
+			var kept = {};
+			var changed = [];
+			data.cards.forEach(function(entry) {
+				var card = stored[entry.id];
+				if (card && card.hash === entry.hash) {
+					kept[entry.id] = card;
+				} else {
+					changed.push(entry.id);
+				}
+			});
+			fetchCards(changed, kept, function() {
+				save(cardsKey, kept);
+				showCards(data.cards, kept);
+			});
+		});
+	}
+
+	function showComments(comments) {
+		var list = document.getElementById('comment-list');
+		list.innerHTML = '';
+		comments.forEach(function(comment) {
+			list.appendChild(cardElement(null, comment.author.name + ' on ' + comment.date, function(topic) {
+				topic.textContent = comment.content;
+			}));
+		});
+		if (comments.length >= COMMENTS_PER_PAGE) {
+			var older = element('div', 'worksession');
+			var paragraph = element('p');
+			var link = element('a', null, 'Older comments');
+			link.href = base + '/comments?before=' + comments[comments.length - 1].micros;
+			paragraph.appendChild(link);
+			older.appendChild(paragraph);
+			list.appendChild(older);
+		}
+	}
+
+	function loadComments() {
+		var stored = load(commentsKey) || [];
+		var since = stored.length ? stored[0].micros : 0;
+		get(api + '/comments?since=' + since, function(data) {
+			//when comments were missed, start over from the newest page
+			var comments = data.complete ? data.comments.concat(stored) : data.comments;
+			comments = comments.slice(0, COMMENTS_PER_PAGE);
+			save(commentsKey, comments);
+			showComments(comments);
+		});
+	}
+
+	loadCards();
+	loadComments();
+	setInterval(function() {
+		if (!document.hidden) {
+			loadComments();
+		}
+	}, REFRESH_MS);
+})();
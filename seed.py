@@ -0,0 +1,180 @@
+#import libraries
+import json
+import os
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from coursenotes import Card, Handler, cardlist_key, bump_version, CARDS_VERSION
+from coursenotes import card_document, index_documents, unindex_cards
+from coursenotes import Comment, CommentListing, comments_key, comment_document
+from coursenotes import rebuild_recent_comments, COMMENTS_VERSION
+from coursenotes import recent_comments_key, store_comments
+from coursenotes import DEFAULT_COURSE, COURSE_NAME
+
+
+#card content lives in a data file instead of in the request module; the
+#default course's cards are in data/cards.json, other courses' cards in
+#data/courses/<name>.json
+CARDS_FILE = os.path.join(os.path.dirname(__file__), 'data', 'cards.json')
+COURSES_DIR = os.path.join(os.path.dirname(__file__), 'data', 'courses')
+
+#number of cards written per put_multi round trip
+SEED_BATCH_SIZE = 100
+
+BACKFILL_URL = '/admin/backfill-listings'
+BACKFILL_BATCH_SIZE = 500
+
+MIGRATE_URL = '/admin/migrate-comments'
+MIGRATE_BATCH_SIZE = 100
+
+
+def course_file(course):
+  if course == DEFAULT_COURSE:
+    return CARDS_FILE
+  return os.path.join(COURSES_DIR, '%s.json' % course)
+
+def load_card_data(path=CARDS_FILE):
+  """Reads the card list; a card's order is its position in the file."""
+  with open(path) as f:
+    cards = json.load(f)
+  for order, card in enumerate(cards):
+    card['order'] = order
+  return cards
+
+def seed_cards(cards=None, course=DEFAULT_COURSE):
+  """Upserts a course's cards using their file ids as datastore keys.
+  Only cards whose hash changed are written, and cards no longer in the
+  file are deleted, so re-running the loader is always safe. Every card
+  is indexed for search, so a rerun also repairs a missing index.
+  Returns a dict counting written, unchanged and removed cards.
+  """
+  if cards is None:
+    cards = load_card_data(course_file(course))
+  keys = [ndb.Key(Card, card['id'], parent=cardlist_key(course))
+          for card in cards]
+  existing = ndb.get_multi(keys)
+
+  changed, seeded_cards = [], []
+  for key, card, stored in zip(keys, cards, existing):
+    card = Card(key=key,
+      title=card['title'],
+      content=card['content'],
+      stage=card['stage'],
+      worksession=card.get('worksession'),
+      order=card['order'])
+    if (stored is None or stored.html is None or
+        stored.content_hash != card.compute_hash()):
+      changed.append(card)
+      seeded_cards.append(card)
+    else:
+      seeded_cards.append(stored)
+  for i in range(0, len(changed), SEED_BATCH_SIZE):
+    ndb.put_multi(changed[i:i + SEED_BATCH_SIZE])
+  index_documents(course, [card_document(card) for card in seeded_cards])
+
+  #remove cards that were dropped from the data file
+  seeded = set(keys)
+  stale = [key for key
+           in Card.query(ancestor=cardlist_key(course)).iter(keys_only=True)
+           if key not in seeded]
+  ndb.delete_multi(stale)
+  unindex_cards(course, stale)
+
+  if changed or stale:
+    bump_version(CARDS_VERSION % course)
+  return {'written': len(changed),
+          'unchanged': len(cards) - len(changed),
+          'removed': len(stale)}
+
+
+def backfill_listings(cursor=None):
+  """Writes the listing and the search document of one batch of comments
+  posted before listings and search existed, all of which belong to the
+  default course. Returns the number written and the cursor of the next
+  batch, or None when every comment has been visited."""
+  query = Comment.query(ancestor=comments_key())
+  comments, next_cursor, more = query.fetch_page(BACKFILL_BATCH_SIZE,
+                                                 start_cursor=cursor)
+  ndb.put_multi([CommentListing.for_comment(comment) for comment in comments])
+  index_documents(DEFAULT_COURSE,
+                  [comment_document(comment) for comment in comments])
+  return len(comments), next_cursor if more else None
+
+def migrate_root_comments(cursor=None):
+  """Copies one batch of the comments stored without a parent, as they
+  were before the comments_key() group, into the default course's group
+  with the same ids and dates. The copies are listed, counted and indexed
+  like new comments, and copies already stored are skipped, so a batch
+  can safely run again. Returns the number copied and the cursor of the
+  next batch, or None when every root comment has been visited."""
+  #root keys sort before every key under a Comments group, so the walk
+  #ends at the first comment that already has a parent
+  keys, next_cursor, more = Comment.query().fetch_page(
+    MIGRATE_BATCH_SIZE, start_cursor=cursor, keys_only=True)
+  roots = [key for key in keys if key.parent() is None]
+  copies = [Comment(id=comment.key.id(), parent=comments_key(),
+                    author=comment.author, date=comment.date,
+                    content=comment.content)
+            for comment in ndb.get_multi(roots) if comment is not None]
+  copied = store_comments(DEFAULT_COURSE, copies)
+  index_documents(DEFAULT_COURSE,
+                  [comment_document(comment) for comment in copies])
+  done = not more or len(roots) < len(keys)
+  return len(copied), None if done else next_cursor
+
+
+class SeedHandler(Handler):
+  def get(self):
+    #load a course's data file into Google Datastore and report what changed
+    course = self.request.get('course') or DEFAULT_COURSE
+    if not COURSE_NAME.match(course):
+      self.abort(400)
+    if not os.path.exists(course_file(course)):
+      self.abort(404)
+    result = seed_cards(course=course)
+    self.response.headers['Content-Type'] = 'text/plain'
+    self.write('cards written: %(written)d, unchanged: %(unchanged)d, '
+               'removed: %(removed)d\n' % result)
+
+
+class BackfillListingsHandler(Handler):
+  #writes one batch, then queues itself for the next until none are left
+  def post(self):
+    cursor = self.request.get('cursor')
+    written, next_cursor = backfill_listings(
+      ndb.Cursor(urlsafe=cursor) if cursor else None)
+    if next_cursor is not None:
+      taskqueue.add(url=BACKFILL_URL,
+                    params={'cursor': next_cursor.urlsafe()})
+    else:
+      #a snapshot built from the partial feed before the backfill finished
+      #would otherwise be kept
+      recent_comments_key().delete()
+      rebuild_recent_comments()
+      bump_version(COMMENTS_VERSION % DEFAULT_COURSE)
+    self.response.headers['Content-Type'] = 'text/plain'
+    self.write('listings written: %d, done: %s\n' % (
+      written, next_cursor is None))
+
+  get = post
+
+
+class MigrateCommentsHandler(Handler):
+  #copies one batch, then queues itself for the next until none are left;
+  #the snapshot is rebuilt at the end so it reflects the whole feed
+  def post(self):
+    cursor = self.request.get('cursor')
+    copied, next_cursor = migrate_root_comments(
+      ndb.Cursor(urlsafe=cursor) if cursor else None)
+    if next_cursor is not None:
+      taskqueue.add(url=MIGRATE_URL,
+                    params={'cursor': next_cursor.urlsafe()})
+    else:
+      recent_comments_key().delete()
+      rebuild_recent_comments()
+      bump_version(COMMENTS_VERSION % DEFAULT_COURSE)
+    self.response.headers['Content-Type'] = 'text/plain'
+    self.write('comments copied: %d, done: %s\n' % (
+      copied, next_cursor is None))
+
+  get = post
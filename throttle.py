@@ -0,0 +1,132 @@
+#import libraries
+import hashlib
+import re
+import threading
+import time
+from google.appengine.api import memcache
+
+
+#each client may post COMMENT_BURST comments at once, then one more every
+#COMMENT_INTERVAL seconds; the same text is refused for DUPLICATE_WINDOW
+COMMENT_BURST = 5
+COMMENT_INTERVAL = 12.0
+DUPLICATE_WINDOW = 600
+
+#the local counters are dropped when they grow past this many clients
+LOCAL_LIMIT = 10000
+
+WHITESPACE = re.compile(r'\s+', re.UNICODE)
+
+
+class LocalCounters(object):
+  """Per-instance stand-in for the memcache counters, guarded by a lock."""
+  def __init__(self):
+    self.values = {}
+    self.lock = threading.Lock()
+
+  def update(self, key, change, expires, peek=()):
+    """Replaces the value at key with change(value)[0] unless that is
+    None. Returns change(value)[1] and the set of peek keys present."""
+    with self.lock:
+      now = time.time()
+      found = set(name for name in peek
+                  if self.values.get(name, (None, 0))[1] > now)
+      value, expires_at = self.values.get(key, (None, 0))
+      value, result = change(value if expires_at > now else None)
+      if value is not None:
+        self.store(key, value, now + expires)
+      return result, found
+
+  def record(self, key, expires):
+    with self.lock:
+      self.store(key, 1, time.time() + expires)
+
+  def store(self, key, value, expires_at):
+    if len(self.values) >= LOCAL_LIMIT:
+      self.values.clear()
+    self.values[key] = (value, expires_at)
+
+
+class MemcacheCounters(object):
+  """Counters shared by every instance, updated with compare-and-set."""
+  def __init__(self, retries=5):
+    self.client = memcache.Client()
+    self.retries = retries
+
+  def update(self, key, change, expires, peek=()):
+    """Like LocalCounters.update. The peek keys are read together with the
+    value, so an uncontended update is two round trips: one get_multi and
+    one add or cas. An unreachable memcache finds nothing, so an outage
+    lets posts through instead of refusing them."""
+    values = self.client.get_multi([key] + list(peek), for_cas=True)
+    found = set(name for name in peek if name in values)
+    stored = values.get(key)
+    for _ in range(self.retries):
+      value, result = change(stored)
+      if value is None:
+        return result, found
+      if stored is None:
+        if self.client.add(key, value, time=expires):
+          return result, found
+      elif self.client.cas(key, value, time=expires):
+        return result, found
+      stored = self.client.gets(key)
+    #contended beyond the retries: let the post through rather than stall
+    return True, found
+
+  def record(self, key, expires):
+    self.client.set(key, 1, time=expires)
+
+
+#the local counters see only this instance's posts, so a client they refuse
+#would be refused by the shared counters too; they answer without an RPC
+local = LocalCounters()
+shared = MemcacheCounters()
+
+#outcomes of check_comment
+ALLOWED = 'allowed'
+THROTTLED = 'throttled'
+DUPLICATE = 'duplicate'
+
+
+def take_token(counters, client, now, posted):
+  """Spends one of the client's tokens and looks up the posted key.
+  The bucket is stored as the time at which it will be full again, so an
+  update is a single value. Returns whether a token was left and whether
+  the text was posted before."""
+  def change(full_at):
+    full_at = max(full_at or now, now) + COMMENT_INTERVAL
+    if full_at - now > COMMENT_BURST * COMMENT_INTERVAL:
+      return None, False
+    return full_at, True
+  allowed, found = counters.update('throttle:' + client, change,
+                                   COMMENT_BURST * COMMENT_INTERVAL,
+                                   peek=[posted])
+  return allowed, posted in found
+
+def posted_key(client, content):
+  """Names a client's text; case and whitespace are ignored."""
+  text = WHITESPACE.sub(' ', content).strip().lower()
+  digest = hashlib.sha1(text.encode('utf-8')).hexdigest()
+  return 'posted:%s:%s' % (client, digest)
+
+def check_comment(client, content):
+  """Returns THROTTLED when client (a user id or address) must wait before
+  posting, DUPLICATE when it posted the same text within the window, and
+  ALLOWED otherwise."""
+  now = time.time()
+  posted = posted_key(client, content)
+  for counters in (local, shared):
+    allowed, duplicate = take_token(counters, client, now, posted)
+    if not allowed:
+      return THROTTLED
+    if duplicate:
+      return DUPLICATE
+  return ALLOWED
+
+def record_posting(client, content):
+  """Remembers the text once the comment is stored, so a post that failed
+  can be sent again without being taken for a duplicate."""
+  posted = posted_key(client, content)
+  local.record(posted, DUPLICATE_WINDOW)
+  shared.record(posted, DUPLICATE_WINDOW)
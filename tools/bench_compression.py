@@ -0,0 +1,64 @@
+"""Measures response compression: bytes on the wire and CPU per request.
+
+The app runs in-process against the testbed stubs, loaded as for
+loadtest.py. Each page is requested without Accept-Encoding, with gzip
+while the compressed-body cache is cleared before every request (so each
+response is compressed), and with gzip as deployed, where repeat requests
+for the same content reuse the cached compressed body.
+
+  python tools/bench_compression.py [--sdk PATH] [--requests 100]
+"""
+import argparse
+import time
+
+import sdk
+
+
+PAGES = ['/', '/stage/2', '/api/v1/cards', '/comments']
+
+SETUPS = [
+  ('identity', {}, False),
+  ('gzip, every request', {'Accept-Encoding': 'gzip'}, True),
+  ('gzip, cached', {'Accept-Encoding': 'gzip'}, False),
+]
+
+
+def measure(test, path, headers, clear_cache, requests):
+  """Returns the mean bytes and CPU milliseconds per request."""
+  import compress
+  sizes, cpu = [], []
+  for _ in range(requests):
+    if clear_cache:
+      compress.cache.clear()
+    start = time.clock()
+    size = test.request(path, headers=dict(headers))[1]
+    cpu.append((time.clock() - start) * 1000)
+    sizes.append(size)
+  return sum(sizes) / len(sizes), sum(cpu) / len(cpu)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--sdk', help='path to the App Engine SDK')
+  parser.add_argument('--cards', type=int, default=50)
+  parser.add_argument('--comments', type=int, default=1000)
+  parser.add_argument('--requests', type=int, default=100,
+                      help='requests per page and setup')
+  args = parser.parse_args()
+  args.write_behind = False
+
+  sdk.setup(args.sdk)
+  import loadtest
+  test = loadtest.LoadTest(args)
+  test.load()
+  test.sign_in(False)
+
+  print '%-16s %-22s %10s %10s' % ('page', 'setup', 'bytes', 'CPU ms')
+  for path in PAGES:
+    for name, headers, clear_cache in SETUPS:
+      size, cpu_ms = measure(test, path, headers, clear_cache, args.requests)
+      print '%-16s %-22s %10d %10.3f' % (path, name, size, cpu_ms)
+
+
+if __name__ == '__main__':
+  main()
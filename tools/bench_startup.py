@@ -0,0 +1,66 @@
+"""Measures the cold-start cost of importing coursenotes.app.
+
+Each run imports the app in a fresh interpreter and records the import
+time and the growth in peak memory, which is what a new instance pays
+before it can serve its first request.
+
+  python tools/bench_startup.py [--sdk PATH] [--runs N]
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import time
+
+import sdk
+
+
+def measure():
+  """Imports the app once and prints the cost as a JSON line."""
+  rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  start = time.time()
+  import coursenotes
+  coursenotes.app
+  import_ms = (time.time() - start) * 1000
+  rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  print json.dumps({'import_ms': import_ms,
+                    'rss_kb': rss_after - rss_before,
+                    'seed_loaded': 'seed' in sys.modules})
+
+
+def median(values):
+  values = sorted(values)
+  return values[len(values) // 2]
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--sdk', help='path to the App Engine SDK')
+  parser.add_argument('--runs', type=int, default=10)
+  parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  sdk.setup(args.sdk)
+  if args.child:
+    measure()
+    return
+
+  command = [sys.executable, __file__, '--child']
+  if args.sdk:
+    command += ['--sdk', args.sdk]
+  runs = [json.loads(subprocess.check_output(command).splitlines()[-1])
+          for _ in range(args.runs)]
+
+  times = [run['import_ms'] for run in runs]
+  memory = [run['rss_kb'] for run in runs]
+  print 'runs:            %d' % len(runs)
+  print 'import time ms:  min %.1f  median %.1f  max %.1f' % (
+    min(times), median(times), max(times))
+  print 'peak memory KB:  min %d  median %d  max %d' % (
+    min(memory), median(memory), max(memory))
+  print 'seed data loaded at import: %s' % any(run['seed_loaded'] for run in runs)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,99 @@
+"""Compares template cost with and without precompiled templates.
+
+For each setup this reports the first render in a fresh environment (what
+the first request on a new instance pays) and the mean cost of later
+renders of coursenotes.html with the seeded cards and a page of comments.
+
+  python tools/bench_templates.py [--sdk PATH] [--renders N]
+"""
+import argparse
+import datetime
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import sdk
+
+
+class Record(object):
+  """Stands in for a datastore entity when rendering."""
+  def __init__(self, **fields):
+    self.__dict__.update(fields)
+
+class Key(object):
+  """Stands in for a datastore key."""
+  def __init__(self, key_id):
+    self.key_id = key_id
+
+  def id(self):
+    return self.key_id
+
+
+def sample_params():
+  #cards are rendered from their stored html, keyed by their file ids
+  with open(os.path.join(sdk.ROOT, 'data', 'cards.json')) as f:
+    cards = [Record(key=Key(card['id']), html=card['content'], **card)
+             for card in json.load(f)]
+  comments = [Record(author=Record(name='Student %d' % i),
+                     date=datetime.datetime(2015, 1, 1),
+                     content='Comment number %d' % i)
+              for i in range(20)]
+  return {'cards': cards, 'comments': comments, 'next_cursor': 'cursor',
+          'greeting': '<!--greeting-->', 'course_path': ''}
+
+
+def environment(loader, **options):
+  """Builds an environment with the globals base.html uses, linking the
+  unbuilt assets as the dev server does."""
+  import jinja2
+  env = jinja2.Environment(loader=loader, autoescape=True, **options)
+  env.globals.update(asset_url=lambda path: '/' + path,
+                     critical_css=lambda: '')
+  return env
+
+
+def benchmark(make_env, params, renders):
+  start = time.time()
+  env = make_env()
+  env.get_template('coursenotes.html').render(params)
+  first_ms = (time.time() - start) * 1000
+
+  start = time.time()
+  for _ in range(renders):
+    env.get_template('coursenotes.html').render(params)
+  return first_ms, (time.time() - start) * 1000 / renders
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--sdk', help='path to the App Engine SDK')
+  parser.add_argument('--renders', type=int, default=200)
+  args = parser.parse_args()
+
+  sdk.setup(args.sdk)
+  import jinja2
+  import compile_templates
+
+  template_dir = os.path.join(sdk.ROOT, 'templates')
+  compiled_dir = tempfile.mkdtemp()
+  try:
+    compile_templates.compile_templates(compiled_dir)
+    setups = [
+      ('template files, auto_reload', lambda: environment(
+        jinja2.FileSystemLoader(template_dir))),
+      ('precompiled, no auto_reload', lambda: environment(
+        jinja2.ModuleLoader(compiled_dir), auto_reload=False)),
+    ]
+    params = sample_params()
+    print '%-30s %14s %14s' % ('setup', 'first ms', 'per render ms')
+    for name, make_env in setups:
+      first_ms, render_ms = benchmark(make_env, params, args.renders)
+      print '%-30s %14.2f %14.3f' % (name, first_ms, render_ms)
+  finally:
+    shutil.rmtree(compiled_dir)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,103 @@
+"""Builds the fingerprinted static assets for deployment.
+
+Run this before every deploy, next to compile_templates.py. Each file
+under styles/, scripts/ and images/ is copied to static/ with a hash of
+its content in the name, stylesheets minified first, and assets.json maps
+the source paths to the new URLs. app.yaml serves static/ with a one-year
+expiration: a changed file gets a new name, so browsers never revalidate.
+
+The rules styling the top of the page are also collected as critical
+CSS, which base.html inlines when INLINE_CRITICAL_CSS is 'true'.
+
+  python tools/build_assets.py
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import sdk
+
+SOURCE_DIRS = ('styles', 'scripts', 'images')
+TARGET_DIR = 'static'
+MANIFEST = 'assets.json'
+
+#selectors of the title, navigation and first cards, shown before scrolling
+CRITICAL_SELECTOR = re.compile(
+  r'^(body|\.title|\.tab-nav|\.italic|#plainlink|\.stage|\.worksession|\.card)'
+  r'\b')
+
+COMMENTS = re.compile(r'/\*.*?\*/', re.DOTALL)
+IMPORTS = re.compile(r'@import[^;]*;')
+SPACE = re.compile(r'\s+')
+PUNCTUATION_SPACE = re.compile(r'\s*([{};,>])\s*')
+RULE = re.compile(r'([^{}]+)\{([^{}]*)\}')
+
+
+def minify_css(css):
+  """Strips comments and the whitespace that does not change meaning."""
+  css = SPACE.sub(' ', COMMENTS.sub('', css))
+  css = PUNCTUATION_SPACE.sub(r'\1', css)
+  return css.replace(';}', '}').replace(': ', ':').strip()
+
+def critical_css(minified):
+  """Returns the rules whose selectors all match CRITICAL_SELECTOR.
+  @import rules are left out, so the inlined CSS never blocks on them."""
+  rules = []
+  for selectors, declarations in RULE.findall(IMPORTS.sub('', minified)):
+    if all(CRITICAL_SELECTOR.match(selector)
+           for selector in selectors.split(',')):
+      rules.append('%s{%s}' % (selectors, declarations))
+  return ''.join(rules)
+
+def fingerprinted(path, content):
+  """Inserts a hash of content before the extension of path."""
+  base, extension = os.path.splitext(path)
+  return '%s.%s%s' % (base, hashlib.sha1(content).hexdigest()[:10], extension)
+
+def build_assets(root):
+  """Writes root/static and root/assets.json, replacing what was there.
+  Returns the manifest."""
+  target = os.path.join(root, TARGET_DIR)
+  if os.path.isdir(target):
+    shutil.rmtree(target)
+  manifest = {'files': {}, 'critical_css': ''}
+  for source_dir in SOURCE_DIRS:
+    for directory, _, names in os.walk(os.path.join(root, source_dir)):
+      for name in sorted(names):
+        source = os.path.join(directory, name)
+        path = os.path.relpath(source, root).replace(os.sep, '/')
+        with open(source, 'rb') as f:
+          content = f.read()
+        if name.endswith('.css'):
+          content = minify_css(content)
+          manifest['critical_css'] += critical_css(content)
+        built = fingerprinted(path, content)
+        output = os.path.join(target, built)
+        if not os.path.isdir(os.path.dirname(output)):
+          os.makedirs(os.path.dirname(output))
+        with open(output, 'wb') as f:
+          f.write(content)
+        manifest['files'][path] = '/%s/%s' % (TARGET_DIR, built)
+
+  #pages cached under one build are not served with another
+  manifest['version'] = hashlib.sha1(
+    json.dumps(manifest, sort_keys=True)).hexdigest()[:10]
+  with open(os.path.join(root, MANIFEST), 'w') as f:
+    json.dump(manifest, f, indent=2, sort_keys=True)
+  return manifest
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.parse_args()
+  manifest = build_assets(sdk.ROOT)
+  for path, url in sorted(manifest['files'].items()):
+    print '%s -> %s' % (path, url)
+  print 'critical CSS: %d bytes' % len(manifest['critical_css'])
+
+
+if __name__ == '__main__':
+  main()
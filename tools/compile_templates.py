@@ -0,0 +1,42 @@
+"""Precompiles the Jinja2 templates for deployment.
+
+Run this before every deploy. The compiled modules go to
+templates_compiled/, which coursenotes loads with a ModuleLoader so
+deployed instances neither parse templates nor stat the template files.
+
+  python tools/compile_templates.py [--sdk PATH]
+"""
+import argparse
+import os
+import shutil
+
+import sdk
+
+
+def compile_templates(target):
+  """Compiles every template into target, replacing what was there."""
+  import jinja2
+  if os.path.isdir(target):
+    shutil.rmtree(target)
+  env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(os.path.join(sdk.ROOT, 'templates')),
+    autoescape=True)
+  env.compile_templates(target, zip=None, py_compile=False,
+                        ignore_errors=False)
+  return sorted(env.list_templates())
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--sdk', help='path to the App Engine SDK')
+  args = parser.parse_args()
+
+  #compile with the Jinja2 bundled in the SDK, the version production runs
+  sdk.setup(args.sdk)
+  target = os.path.join(sdk.ROOT, 'templates_compiled')
+  for name in compile_templates(target):
+    print 'compiled %s' % name
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,110 @@
+"""Downloads a course's comments or cards from /admin/export.
+
+The export arrives in batches, each followed by a cursor line. A batch
+is written to the output only once its cursor has arrived, so when a
+request times out or the connection drops, the download continues from
+the last complete batch without duplicating or losing records. Memory
+use is one batch, whatever the size of the course.
+
+/admin/ requires an administrator, so pass the session cookie of a
+signed-in admin (copied from the browser) with --cookie.
+
+  python tools/export_data.py https://APP.appspot.com comments.jsonl \\
+    [--kind comments|cards] [--format jsonl|csv] [--course NAME] \\
+    [--cookie 'SACSID=...'] [--cursor CURSOR]
+
+An interrupted download prints its cursor; rerun with --cursor and the
+same output file to append the rest.
+"""
+import argparse
+import csv
+import json
+import sys
+import time
+import urllib
+import urllib2
+
+#matches export.CURSOR_MARKER in the app
+CURSOR_MARKER = '#cursor'
+RETRY_SECONDS = 5
+
+
+def jsonl_batches(response):
+  """Yields (lines, cursor) for each complete batch in the response."""
+  lines = []
+  for line in response:
+    record = json.loads(line)
+    if CURSOR_MARKER in record:
+      yield lines, record[CURSOR_MARKER]
+      lines = []
+    else:
+      lines.append(line)
+
+def csv_batches(response):
+  rows = []
+  for row in csv.reader(response):
+    if row and row[0] == CURSOR_MARKER:
+      yield rows, row[1] or None
+      rows = []
+    else:
+      rows.append(row)
+
+def export_url(args, cursor):
+  params = {'kind': args.kind, 'format': args.format, 'course': args.course}
+  if cursor:
+    params['cursor'] = cursor
+  return '%s/admin/export?%s' % (args.url.rstrip('/'),
+                                 urllib.urlencode(params))
+
+def download(args):
+  """Fetches batches until the export is complete, resuming from the last
+  cursor after a failed request. Returns the number of records written."""
+  cursor = args.cursor
+  written = 0
+  failures = 0
+  with open(args.output, 'ab' if cursor else 'wb') as f:
+    writer = csv.writer(f) if args.format == 'csv' else None
+    batches = csv_batches if args.format == 'csv' else jsonl_batches
+    while True:
+      request = urllib2.Request(export_url(args, cursor))
+      if args.cookie:
+        request.add_header('Cookie', args.cookie)
+      try:
+        for records, cursor in batches(urllib2.urlopen(request)):
+          if writer:
+            writer.writerows(records)
+          else:
+            f.writelines(records)
+          f.flush()
+          written += len(records)
+          failures = 0
+          print '%d records, cursor %s' % (written, cursor or '(done)')
+          if cursor is None:
+            return written
+      except (urllib2.URLError, IOError, ValueError) as error:
+        failures += 1
+        if failures > args.retries:
+          sys.exit('export stopped: %s; resume with --cursor %s' % (
+            error, cursor))
+        print 'request failed (%s); resuming in %d s' % (error, RETRY_SECONDS)
+        time.sleep(RETRY_SECONDS)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('url', help='the app, e.g. https://APP.appspot.com')
+  parser.add_argument('output', help='file to write the records to')
+  parser.add_argument('--kind', choices=('comments', 'cards'),
+                      default='comments')
+  parser.add_argument('--format', choices=('jsonl', 'csv'), default='jsonl')
+  parser.add_argument('--course', default='default')
+  parser.add_argument('--cookie', help='session cookie of an admin')
+  parser.add_argument('--cursor', help='resume after this cursor')
+  parser.add_argument('--retries', type=int, default=5,
+                      help='failed requests in a row before giving up')
+  args = parser.parse_args()
+  print 'exported %d records to %s' % (download(args), args.output)
+
+
+if __name__ == '__main__':
+  main()
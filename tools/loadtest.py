@@ -0,0 +1,307 @@
+"""Drives coursenotes.app in-process against the SDK's local service stubs.
+
+The datastore, memcache, task queue, search and Users API are the App
+Engine testbed stubs, so no network or deployed app is needed. The
+datastore stub enforces index.yaml, so a query missing its index fails
+here as it would in production. After loading the cards and comments,
+each scenario is replayed through WSGI and reported with p50/p99 latency,
+queries and datastore RPCs per request, and bytes rendered.
+
+  python tools/loadtest.py [--sdk PATH] [--cards 50] [--comments 10000]
+
+With --write-behind, posts go through the comment queue (the testbed's
+task queue stub) and the queue is drained after the run. Either way, the
+run fails if the stored comments do not match the comments posted.
+
+With --baseline, the run fails (exit status 1) when a scenario makes more
+datastore RPCs than the baseline or its p99 exceeds the baseline by more
+than --tolerance. --save-baseline records the current run instead.
+"""
+import argparse
+import collections
+import datetime
+import json
+import os
+import sys
+import time
+
+import sdk
+
+
+class RpcCounter(object):
+  """Counts service calls made through the API proxy."""
+  def __init__(self):
+    self.calls = collections.Counter()
+
+  def __call__(self, service, call, request, response):
+    self.calls[call] += 1
+
+  def queries(self):
+    return self.calls['RunQuery']
+
+  def total(self):
+    return sum(self.calls.values())
+
+  def reset(self):
+    self.calls.clear()
+
+
+def percentile(values, fraction):
+  values = sorted(values)
+  return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class LoadTest(object):
+  def __init__(self, args):
+    from google.appengine.api import apiproxy_stub_map
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+
+    self.args = args
+    self.testbed = testbed.Testbed()
+    self.testbed.activate()
+    self.testbed.setup_env(app_id='coursenotes', overwrite=True)
+    self.testbed.init_datastore_v3_stub(
+      require_indexes=True, root_path=sdk.ROOT,
+      consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+        probability=1))
+    self.testbed.init_memcache_stub()
+    self.testbed.init_user_stub()
+    self.testbed.init_taskqueue_stub(root_path=sdk.ROOT)
+    self.testbed.init_search_stub()
+
+    self.rpcs = RpcCounter()
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+      'loadtest', self.rpcs, 'datastore_v3')
+
+    import coursenotes
+    import seed
+    self.coursenotes = coursenotes
+    self.seed = seed
+    coursenotes.WRITE_BEHIND = args.write_behind
+    self.posted = 0
+
+  def load(self):
+    """Seeds the cards and writes the comments and their listings in
+    batches."""
+    from google.appengine.ext import ndb
+    cards = self.seed.load_card_data()
+    cards = [dict(cards[i % len(cards)], id='card%d' % (i + 1), order=i)
+             for i in range(self.args.cards)]
+    self.seed.seed_cards(cards)
+
+    start = datetime.datetime(2015, 1, 1)
+    for first in range(0, self.args.comments, 500):
+      batch = []
+      for i in range(first, min(first + 500, self.args.comments)):
+        batch.append(self.coursenotes.Comment(
+          parent=self.coursenotes.comments_key(),
+          author=self.coursenotes.Author(
+            identity='student%d' % (i % 100), name='Student %d' % (i % 100),
+            email='student%d@example.com' % (i % 100)),
+          content='Comment number %d about flexbox and GET vs. POST' % i,
+          date=start + datetime.timedelta(seconds=i)))
+      ndb.put_multi(batch)
+      ndb.put_multi([self.coursenotes.CommentListing.for_comment(comment)
+                     for comment in batch])
+
+  def sign_in(self, signed_in):
+    if signed_in:
+      self.testbed.setup_env(USER_EMAIL='student@example.com',
+                             USER_ID='123', USER_IS_ADMIN='0', overwrite=True)
+    else:
+      self.testbed.setup_env(USER_EMAIL='', USER_ID='', USER_IS_ADMIN='0',
+                             overwrite=True)
+
+  def request(self, path, post=None, headers=None, remote_addr='10.0.0.1'):
+    """Sends one request through WSGI; returns (ms, bytes, response)."""
+    import webapp2
+    from google.appengine.ext import ndb
+    ndb.get_context().clear_cache()
+    request = webapp2.Request.blank(path.split('#')[0], POST=post,
+                                    headers=headers or {},
+                                    remote_addr=remote_addr)
+    self.rpcs.reset()
+    start = time.time()
+    response = request.get_response(self.coursenotes.app)
+    elapsed = (time.time() - start) * 1000
+    return elapsed, len(response.body), response
+
+  def scenarios(self):
+    """Yields (name, request function) pairs; each call makes one request."""
+    def anonymous_view():
+      self.sign_in(False)
+      return self.request('/')
+
+    def signed_in_view():
+      self.sign_in(True)
+      return self.request('/')
+
+    def revalidate():
+      self.sign_in(False)
+      etag = self.request('/')[2].headers['ETag']
+      return self.request('/', headers={'If-None-Match': etag})
+
+    #each post comes from its own address so the comment throttle allows it
+    def post_then_view():
+      self.sign_in(False)
+      address = '10.1.%d.%d' % divmod(self.posted, 256)
+      response = self.request('/', post={'content': 'A new comment',
+                                         'name': 'Load', 'email': ''},
+                              remote_addr=address)[2]
+      self.posted += 1
+      return self.request(response.headers['Location'])
+
+    def older_comments():
+      self.sign_in(False)
+      page = self.coursenotes.fetch_comment_page()[1]
+      return self.request('/comments?cursor=%s' % page)
+
+    def stage_page():
+      self.sign_in(False)
+      return self.request('/stage/2')
+
+    def search():
+      self.sign_in(False)
+      return self.request('/search?q=flexbox')
+
+    def cards_api():
+      self.sign_in(False)
+      return self.request('/api/v1/cards')
+
+    def comments_api():
+      self.sign_in(False)
+      newest = self.coursenotes.fetch_comment_page()[0][0]
+      since = self.coursenotes.to_micros(newest.date) - 1
+      return self.request('/api/v1/comments?since=%d' % since)
+
+    def stats():
+      self.sign_in(True)
+      return self.request('/stats')
+
+    return [
+      ('anonymous view', anonymous_view),
+      ('signed-in view', signed_in_view),
+      ('conditional GET', revalidate),
+      ('post then view', post_then_view),
+      ('older comments', older_comments),
+      ('stage page', stage_page),
+      ('search', search),
+      ('cards API', cards_api),
+      ('comments API', comments_api),
+      ('stats', stats),
+    ]
+
+  def run(self):
+    results = collections.OrderedDict()
+    for name, scenario in self.scenarios():
+      times, queries, rpcs, sizes = [], [], [], []
+      for _ in range(self.args.requests):
+        elapsed, size, response = scenario()
+        if response.status_int >= 400:
+          sys.exit('%s failed: %s' % (name, response.status))
+        times.append(elapsed)
+        queries.append(self.rpcs.queries())
+        rpcs.append(self.rpcs.total())
+        sizes.append(size)
+      count = float(self.args.requests)
+      results[name] = {
+        'p50_ms': percentile(times, 0.5),
+        'p99_ms': percentile(times, 0.99),
+        'queries': sum(queries) / count,
+        'datastore_rpcs': sum(rpcs) / count,
+        'bytes': int(sum(sizes) / count),
+      }
+    return results
+
+
+  def check_comments(self):
+    """Drains any queued comments, then checks none were lost or doubled
+    and that the counters saw each posted comment once."""
+    if self.args.write_behind:
+      start = time.time()
+      stored = self.coursenotes.drain_comment_queue()
+      print 'drained %d queued comments in %.1f ms' % (
+        stored, (time.time() - start) * 1000)
+    expected = self.args.comments + self.posted
+    found = self.coursenotes.Comment.query(
+      ancestor=self.coursenotes.comments_key()).count()
+    failures = []
+    if found != expected:
+      failures.append('stored %d comments, expected %d' % (found, expected))
+    #the loaded comments bypass the counters, so only posts are counted
+    name = 'comments:%s' % self.coursenotes.DEFAULT_COURSE
+    self.coursenotes.memcache.delete(name)
+    counted = self.coursenotes.counter_values([name])[name]
+    if counted != self.posted:
+      failures.append('counted %d comments, posted %d' % (
+        counted, self.posted))
+    return failures
+
+
+def report(results):
+  print '%-18s %9s %9s %9s %9s %9s' % (
+    'scenario', 'p50 ms', 'p99 ms', 'queries', 'RPCs', 'bytes')
+  for name, result in results.items():
+    print '%-18s %9.2f %9.2f %9.1f %9.1f %9d' % (
+      name, result['p50_ms'], result['p99_ms'], result['queries'],
+      result['datastore_rpcs'], result['bytes'])
+
+
+def regressions(results, baseline, tolerance):
+  """Lists the scenarios that got slower or chattier than the baseline."""
+  failures = []
+  for name, result in results.items():
+    expected = baseline.get(name)
+    if expected is None:
+      continue
+    if result['datastore_rpcs'] > expected['datastore_rpcs']:
+      failures.append('%s: %.1f datastore RPCs per request, baseline %.1f' % (
+        name, result['datastore_rpcs'], expected['datastore_rpcs']))
+    if result['p99_ms'] > expected['p99_ms'] * tolerance:
+      failures.append('%s: p99 %.2f ms, baseline %.2f ms' % (
+        name, result['p99_ms'], expected['p99_ms']))
+  return failures
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+  parser.add_argument('--sdk', help='path to the App Engine SDK')
+  parser.add_argument('--cards', type=int, default=50)
+  parser.add_argument('--comments', type=int, default=10000)
+  parser.add_argument('--requests', type=int, default=100,
+                      help='requests per scenario')
+  parser.add_argument('--write-behind', action='store_true',
+                      help='queue posted comments and drain them afterwards')
+  parser.add_argument('--baseline', help='JSON file of expected results')
+  parser.add_argument('--save-baseline', action='store_true',
+                      help='write this run to --baseline instead of checking')
+  parser.add_argument('--tolerance', type=float, default=1.5,
+                      help='allowed p99 slowdown factor over the baseline')
+  args = parser.parse_args()
+
+  sdk.setup(args.sdk)
+  test = LoadTest(args)
+  start = time.time()
+  test.load()
+  print 'loaded %d cards and %d comments in %.1f s' % (
+    args.cards, args.comments, time.time() - start)
+  results = test.run()
+  report(results)
+  failures = test.check_comments()
+
+  if args.baseline and args.save_baseline:
+    with open(args.baseline, 'w') as f:
+      json.dump(results, f, indent=2)
+    print 'baseline written to %s' % args.baseline
+  elif args.baseline and os.path.exists(args.baseline):
+    with open(args.baseline) as f:
+      failures += regressions(results, json.load(f), args.tolerance)
+  for failure in failures:
+    print 'FAIL %s' % failure
+  if failures:
+    sys.exit(1)
+
+
+if __name__ == '__main__':
+  main()
@@ -0,0 +1,27 @@
+"""Puts the App Engine SDK and the app itself on sys.path for tool scripts.
+
+The SDK is found from --sdk, the APPENGINE_SDK environment variable, or
+the directory holding dev_appserver.py on PATH.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def find_sdk(sdk_path=None):
+  if sdk_path or os.environ.get('APPENGINE_SDK'):
+    return sdk_path or os.environ['APPENGINE_SDK']
+  for directory in os.environ.get('PATH', '').split(os.pathsep):
+    candidate = os.path.join(directory, 'dev_appserver.py')
+    if os.path.exists(candidate):
+      return os.path.dirname(os.path.realpath(candidate))
+  sys.exit('App Engine SDK not found; pass --sdk or set APPENGINE_SDK')
+
+
+def setup(sdk_path=None):
+  """Makes google.appengine, the bundled libraries and the app importable."""
+  sys.path.insert(0, find_sdk(sdk_path))
+  import dev_appserver
+  dev_appserver.fix_sys_path()
+  sys.path.insert(0, ROOT)